@@ -3,14 +3,27 @@ import json
 import numpy as np
 import re
 import time
+import logging
+import heapq
+import threading
 import boto3
-import traceback
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 from botocore.config import Config
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
 from strands import Agent, tool
 from strands.models import BedrockModel
 
+# orjson parses the float-heavy embedding payloads several times faster; fall back to stdlib json
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    json_dumps, json_loads = json.dumps, json.loads
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(), format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
 # ==== AWS config with defaults for local testing ====
 s3_vector_bucket = os.environ["VECTOR_BUCKET_NAME"]
 index_name = os.environ["INDEX_NAME"]
@@ -19,16 +32,11 @@ reasoning_model_id = os.environ["REASONING_MODEL_ID"]
 aws_region = os.environ["AWS_REGION"]
 
 # Log all environment variables for debugging
-print("\n==== DEBUG: App startup environment ====")
-print("VECTOR_BUCKET_NAME:", s3_vector_bucket)
-print("INDEX_NAME:", index_name)
-print("MODEL_ID:", model_id)
-print("REASONING_MODEL_ID:", reasoning_model_id)
-print("REGION:", aws_region)
-print("All environment variables:", {k: v for k, v in os.environ.items() if k in [
+logger.debug("App startup environment: VECTOR_BUCKET_NAME=%s INDEX_NAME=%s MODEL_ID=%s REASONING_MODEL_ID=%s REGION=%s",
+             s3_vector_bucket, index_name, model_id, reasoning_model_id, aws_region)
+logger.debug("All environment variables: %s", {k: v for k, v in os.environ.items() if k in [
     "VECTOR_BUCKET_NAME", "INDEX_NAME", "MODEL_ID", "REASONING_MODEL_ID", "REGION", "AWS_DEFAULT_REGION"
 ]})
-print("========================================\n")
 
 # Validate environment variables
 missing_vars = []
@@ -44,72 +52,262 @@ for var, value in [
 
 if missing_vars:
     error_msg = f"ERROR: Missing required environment variables: {', '.join(missing_vars)}. Using defaults for local testing."
-    print(f"DEBUG: {error_msg}")
+    logger.warning(error_msg)
 else:
-    print("DEBUG: All required environment variables are set.")
+    logger.debug("All required environment variables are set.")
 
 app = BedrockAgentCoreApp()
 
-def get_aws_session():
-    session = boto3.Session(region_name=aws_region)
-    print(f"DEBUG: boto3.Session region_name={session.region_name}")
-    return session, None
+# ==== AWS session and clients ====
+# Built once at import and reused by every invocation; client creation loads the
+# service models and resolves endpoints, and low-level clients are thread-safe.
+_SESSION = boto3.Session(region_name=aws_region)
+logger.debug("boto3.Session region_name=%s", _SESSION.region_name)
+_BEDROCK = _SESSION.client('bedrock-runtime', config=Config(retries={'max_attempts': 3, 'mode': 'standard'}))
+_S3VECTORS = _SESSION.client('s3vectors', config=Config(retries={'max_attempts': 3, 'mode': 'standard'}))
 
-@tool
-def search_transcripts(query: str) -> dict:
+def get_aws_session():
+    return _SESSION, None
+
+# ==== Persona terms and keyword synonyms ====
+LEADERSHIP_TERMS = ("ciso", "leader", "leadership", "executive", "manager", "governance", "strategy", "compliance", "policy", "risk", "identity", "security", "authentication", "authorization")
+TECHNICAL_TERMS = ("engineer", "developer", "implementation", "api", "code", "technical", "tool", "sdk", "programming", "configuration", "mcp", "bedrock", "cognito")
+SYNONYMS = {
+    "ciso": ("chief information security officer", "security officer"),
+    "ai": ("artificial intelligence", "machine learning"),
+    "security": ("cybersecurity", "protection", "secure"),
+    "agentic": ("agent", "autonomous", "intelligent"),
+    "leader": ("executive", "manager", "director"),
+    "engineer": ("developer", "programmer", "technical")
+}
+
+def _terms_regex(terms):
+    # Longest first so multi-word and prefix-sharing terms win the alternation
+    alternation = "|".join(re.escape(t) for t in sorted(set(terms), key=len, reverse=True))
+    return re.compile(r"\b(?:" + alternation + r")\b") if alternation else None
+
+LEADERSHIP_RE = _terms_regex(LEADERSHIP_TERMS)
+TECHNICAL_RE = _terms_regex(TECHNICAL_TERMS)
+WORD_RE = re.compile(r"\w+")
+# Output link key -> Excel metadata column
+LINK_FIELDS = (
+    ("external_youtube_link", "External Youtube Link"),
+    ("content_link", "Content Link"),
+    ("deck_link", "Deck Link"),
+    ("internal_broadcast_link", "Internal Broadcast Video Link")
+)
+_INVALID_LINK_VALUES = frozenset({"not available", ""})
+
+FIRST_TWO_SENTENCES_RE = re.compile(r"[^.]*\.[^.]*\.")
+
+def _first_two_sentences(summary):
+    m = FIRST_TWO_SENTENCES_RE.match(summary)
+    if m:
+        return m.group().strip()
+    # Fewer than two sentences: keep the whole summary, terminated once
+    summary = summary.strip()
+    return summary if summary.endswith('.') else summary + '.'
+
+# ==== Query embedding cache ====
+# Bounded LRU of query embeddings keyed by the normalized query text, so repeated
+# prompts skip the Bedrock round-trip. Only embeddings are cached (not search
+# results), so changes to the vector index are picked up immediately. Entries are
+# contiguous float32 arrays (what S3 Vectors stores) rather than lists of boxed
+# Python floats, about 8x less memory per cached query.
+EMBED_CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", "512"))
+_embed_cache = OrderedDict()
+_embed_cache_lock = threading.Lock()
+
+# Runs the query embedding request concurrently with the query preprocessing
+# that does not depend on it (persona inference, keyword/synonym expansion).
+EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+def _normalize_query(query):
+    # Case and spacing only: punctuation can change meaning ("C++" vs "C#")
+    return " ".join(query.lower().split())
+
+def _embed_cached(bedrock, query):
+    key = _normalize_query(query)
+    with _embed_cache_lock:
+        cached = _embed_cache.get(key)
+        if cached is not None:
+            _embed_cache.move_to_end(key)
+            logger.debug("Embedding cache hit for '%s'", key)
+            return cached.tolist()
+
+    # Call Bedrock outside the lock so concurrent misses are not serialized
+    embedding_response = bedrock.invoke_model(
+        modelId=model_id,
+        body=json_dumps({"inputText": query})
+    )
+    body = embedding_response['body'].read()
+    embedding_data = json_loads(body)
+    if 'embedding' not in embedding_data:
+        return None
+    # Already a list of floats, which is the shape S3 Vectors' queryVector expects
+    query_embedding = embedding_data['embedding']
+
+    with _embed_cache_lock:
+        _embed_cache[key] = np.asarray(query_embedding, dtype=np.float32)
+        _embed_cache.move_to_end(key)
+        while len(_embed_cache) > EMBED_CACHE_SIZE:
+            _embed_cache.popitem(last=False)
+    return query_embedding
+
+def _build_candidates(vectors, keyword_re, persona):
+    candidates = []
+    for result in vectors:
+        content = result.get('metadata', {}).get('source_text', '')
+        content_lower = content.lower()
+        token_count = len(content_lower.split())
+        sem_score = 1 - result.get('distance', 1.0)
+        kw_score = len(keyword_re.findall(content_lower)) / max(1, token_count) if keyword_re else 0.0
+        # Persona term hits in the transcript, shared by the metadata boost and clustering
+        lead_hits = LEADERSHIP_RE.findall(content_lower)
+        tech_hits = TECHNICAL_RE.findall(content_lower)
+
+        # Metadata boost using summary, topics, and source_text
+        metadata = result.get('metadata', {})
+        summary = metadata.get('Video Transcript Summary', 'No summary available.')
+        summary = _first_two_sentences(summary)
+        topics = metadata.get('When Was Each Topic Discussed', '').lower()
+        summary_text = summary.lower() + ' ' + topics
+        matched_terms = []
+        metadata_score = 0.0
+        if persona == "leadership":
+            hits = lead_hits + LEADERSHIP_RE.findall(summary_text)
+        elif persona == "technical":
+            hits = tech_hits + TECHNICAL_RE.findall(summary_text)
+        else:
+            hits = None
+        if hits is not None:
+            combined_count = token_count + len(summary.split()) + len(topics.split())
+            metadata_score = len(hits) / max(1, combined_count)
+            matched_terms = sorted(set(hits))
+
+        candidates.append({
+            'doc_id': result['key'],
+            'content': content,
+            'metadata': metadata,
+            'summary': summary,
+            'semantic_score': sem_score,
+            'keyword_score': kw_score,
+            'metadata_score': metadata_score,
+            'matched_terms': matched_terms,
+            'lead_hits': len(lead_hits),
+            'tech_hits': len(tech_hits)
+        })
+    return candidates
+
+def _blend_scores(candidates, semantic_weight, keyword_weight):
+    # Blend as parallel score columns (one entry per candidate) so normalization
+    # is a single vectorized expression; candidates stay as the side metadata.
+    n = len(candidates)
+    sem = np.fromiter((c['semantic_score'] for c in candidates), dtype=np.float64, count=n)
+    kw = np.fromiter((c['keyword_score'] for c in candidates), dtype=np.float64, count=n)
+    meta = np.fromiter((c['metadata_score'] for c in candidates), dtype=np.float64, count=n)
+    max_kw = kw.max(initial=0.0)
+    max_meta = meta.max(initial=0.0)
+    norm_kw = kw / max_kw if max_kw > 0 else np.zeros_like(kw)
+    norm_meta = meta / max_meta if max_meta > 0 else np.zeros_like(meta)
+    hybrid = semantic_weight * sem + keyword_weight * norm_kw + 0.05 * norm_meta
+    for c, score in zip(candidates, hybrid.tolist()):
+        c['hybrid_score'] = score
+    if logger.isEnabledFor(logging.DEBUG):
+        for c in candidates:
+            logger.debug("Candidate %s: semantic_score=%s, keyword_score=%s, metadata_score=%s, matched_terms=%s, hybrid_score=%s",
+                         c['doc_id'], c['semantic_score'], c['keyword_score'], c['metadata_score'], c['matched_terms'], c['hybrid_score'])
+    return hybrid
+
+def _cluster_top(candidates, hybrid, persona):
+    # Partial top-k selection; nlargest keeps retrieval order on ties like a stable sort
+    scores = hybrid.tolist()
+    if persona == "leadership":
+        is_lead = np.fromiter(
+            (c['lead_hits'] >= c['tech_hits'] for c in candidates),
+            dtype=bool, count=len(candidates)
+        )
+        top_idx = heapq.nlargest(2, np.flatnonzero(is_lead).tolist(), key=scores.__getitem__)
+        if top_idx:
+            if len(top_idx) < 2:
+                top_idx += heapq.nlargest(1, np.flatnonzero(~is_lead).tolist(), key=scores.__getitem__)
+            return [candidates[i] for i in top_idx]
+    return [candidates[i] for i in heapq.nlargest(5, range(len(candidates)), key=scores.__getitem__)]
+
+def _extract_valid_results(top_docs):
+    valid_results = []
+    for doc in top_docs:
+        metadata = doc.get('metadata', {})
+        links = {key: value for key, field in LINK_FIELDS
+                 if (value := metadata.get(field, "")) and value.lower() not in _INVALID_LINK_VALUES}
+        if links:
+            valid_results.append({
+                "doc_id": doc['doc_id'],
+                "links": links,
+                "hybrid_score": doc['hybrid_score'],
+                "summary": doc['summary']
+            })
+    return valid_results
+
+def _refill_valid_results(valid_results, candidates, hybrid, needed=2):
+    # Walk the remaining candidates in hybrid-score order for more docs with valid links
+    seen = {r['doc_id'] for r in valid_results}
+    scores = hybrid.tolist()
+    for i in sorted(range(len(candidates)), key=scores.__getitem__, reverse=True):
+        if len(valid_results) >= needed:
+            break
+        if candidates[i]['doc_id'] not in seen:
+            valid_results.extend(_extract_valid_results([candidates[i]]))
+    return valid_results
+
+def _search_transcripts(query: str) -> dict:
     global model_id, s3_vector_bucket, index_name
-    print(f"\n==== DEBUG: search_transcripts START ====")
-    print(f"Query: {query}, Index: {index_name}, Model: {model_id}, Bucket: {s3_vector_bucket}")
+    logger.debug("search_transcripts start - Query: %s, Index: %s, Model: %s, Bucket: %s", query, index_name, model_id, s3_vector_bucket)
     start_time = time.time()
 
-    session = get_aws_session()[0]
-    bedrock_config = Config(retries={'max_attempts': 3, 'mode': 'standard'})
-    s3vectors_config = Config(retries={'max_attempts': 3, 'mode': 'standard'})
+    bedrock, s3vectors = _BEDROCK, _S3VECTORS
+    logger.debug("Bedrock region: %s, S3Vectors region: %s", bedrock.meta.region_name, s3vectors.meta.region_name)
 
     try:
-        bedrock = session.client('bedrock-runtime', config=bedrock_config)
-        s3vectors = session.client('s3vectors', config=s3vectors_config)
-    except ClientError as e:
-        return {"output": {"message": f"ClientError: {e}"}}
-
-    print(f"DEBUG: Bedrock region: {bedrock.meta.region_name}, S3Vectors region: {s3vectors.meta.region_name}")
+        # 1️⃣ Start the Bedrock embedding request; it overlaps with the steps below
+        embed_start = time.time()
+        embed_future = EXECUTOR.submit(_embed_cached, bedrock, query)
 
-    try:
-        # 1️⃣ Infer persona with confidence
+        # 2️⃣ Infer persona with confidence
         persona_start = time.time()
         query_lower = query.lower()
-        leadership_terms = ["ciso", "leader", "leadership", "executive", "manager", "governance", "strategy", "compliance", "policy", "risk", "identity", "security", "authentication", "authorization"]
-        technical_terms = ["engineer", "developer", "implementation", "api", "code", "technical", "tool", "sdk", "programming", "configuration", "mcp", "bedrock", "cognito"]
-        leadership_conf = sum(query_lower.count(term) for term in leadership_terms) / max(1, len(query_lower.split()))
-        technical_conf = sum(query_lower.count(term) for term in technical_terms) / max(1, len(query_lower.split()))
+        # One tokenizing pass, then whole-word term lookups against the counts
+        query_tokens = WORD_RE.findall(query_lower)
+        query_counts = Counter(query_tokens)
+        leadership_conf = sum(query_counts[term] for term in LEADERSHIP_TERMS) / max(1, len(query_tokens))
+        technical_conf = sum(query_counts[term] for term in TECHNICAL_TERMS) / max(1, len(query_tokens))
         persona = "leadership" if leadership_conf > technical_conf else "technical" if technical_conf > leadership_conf else "general"
-        print(f"DEBUG: Inferred persona: {persona}, leadership_conf={leadership_conf:.3f}, technical_conf={technical_conf:.3f}")
-        print(f"DEBUG: Persona inference time: {time.time() - persona_start:.3f}s")
+        logger.debug("Inferred persona: %s, leadership_conf=%.3f, technical_conf=%.3f", persona, leadership_conf, technical_conf)
+        logger.debug("Persona inference time: %.3fs", time.time() - persona_start)
 
         # Adjust weights based on persona
         semantic_weight = 0.8 if persona == "leadership" else 0.6 if persona == "technical" else 0.7
         keyword_weight = 1.0 - semantic_weight - 0.05
-        print(f"DEBUG: Weights - semantic: {semantic_weight}, keyword: {keyword_weight}, metadata: 0.05")
+        logger.debug("Weights - semantic: %s, keyword: %s, metadata: 0.05", semantic_weight, keyword_weight)
 
-        # 2️⃣ Generate embedding from Bedrock
-        embed_start = time.time()
-        embedding_response = bedrock.invoke_model(
-            modelId=model_id,
-            body=json.dumps({"inputText": query})
-        )
-        body = embedding_response['body'].read()
-        embedding_data = json.loads(body)
-        if 'embedding' not in embedding_data:
+        # Expand query keywords with synonyms
+        keywords = [kw for kw in query_tokens if len(kw) >= 2]
+        all_keywords = keywords + [syn for kw in keywords for syn in SYNONYMS.get(kw, ())]
+        keyword_re = _terms_regex(all_keywords)
+        logger.debug("Keywords: %s, Synonyms: %s", keywords, all_keywords)
+
+        # 3️⃣ Wait for the embedding from Bedrock
+        query_embedding = embed_future.result()
+        if query_embedding is None:
             return {"output": {"message": "NO_RELEVANT_OUTPUT"}}
-        query_embedding = np.array(embedding_data['embedding'])
-        print(f"DEBUG: Embedding generation time: {time.time() - embed_start:.3f}s")
+        logger.debug("Embedding generation time: %.3fs", time.time() - embed_start)
 
-        # 3️⃣ Vector search (initial attempt with topK=10)
+        # 4️⃣ Vector search (initial attempt with topK=10)
         search_start = time.time()
         vector_query = {
             "indexName": index_name,
             "vectorBucketName": s3_vector_bucket,
-            "queryVector": {"float32": query_embedding.tolist()},
+            "queryVector": {"float32": query_embedding},
             "topK": 10,
             "returnMetadata": True,
             "returnDistance": True
@@ -117,190 +315,50 @@ def search_transcripts(query: str) -> dict:
         vector_response = s3vectors.query_vectors(**vector_query)
         if not vector_response.get('vectors'):
             return {"output": {"message": "NO_RELEVANT_OUTPUT"}}
-        print(f"DEBUG: Vector search time: {time.time() - search_start:.3f}s")
+        logger.debug("Vector search time: %.3fs", time.time() - search_start)
 
-        # 4️⃣ Build hybrid scoring with metadata boost
+        # 5️⃣ Build hybrid scoring with metadata boost
         score_start = time.time()
-        candidates = []
-        keywords = [kw for kw in query_lower.split() if len(kw) >= 2]
-        synonyms = {
-            "ciso": ["chief information security officer", "security officer"],
-            "ai": ["artificial intelligence", "machine learning"],
-            "security": ["cybersecurity", "protection", "secure"],
-            "agentic": ["agent", "autonomous", "intelligent"],
-            "leader": ["executive", "manager", "director"],
-            "engineer": ["developer", "programmer", "technical"]
-        }
-        all_keywords = keywords + [syn for kw in keywords for syn in synonyms.get(kw, [])]
-        print(f"DEBUG: Keywords: {keywords}, Synonyms: {all_keywords}")
-
-        for result in vector_response['vectors']:
-            content = result.get('metadata', {}).get('source_text', '')
-            content_lower = content.lower()
-            sem_score = 1 - result.get('distance', 1.0)
-            kw_score = sum(content_lower.count(kw) for kw in all_keywords) / max(1, len(content_lower.split()))
-
-            # Metadata boost using summary, topics, and source_text
-            metadata = result.get('metadata', {})
-            summary = metadata.get('Video Transcript Summary', 'No summary available.')
-            sentences = summary.split('.')
-            summary = '. '.join(sentences[:2]).strip() + ('.' if sentences else '')
-            topics = metadata.get('When Was Each Topic Discussed', '').lower()
-            combined_text = content_lower + ' ' + summary.lower() + ' ' + topics
-            matched_terms = []
-            metadata_score = 0.0
-            if persona == "leadership":
-                metadata_score = sum(combined_text.count(term) for term in leadership_terms) / max(1, len(combined_text.split()))
-                matched_terms = [term for term in leadership_terms if term in combined_text]
-            elif persona == "technical":
-                metadata_score = sum(combined_text.count(term) for term in technical_terms) / max(1, len(combined_text.split()))
-                matched_terms = [term for term in technical_terms if term in combined_text]
-
-            candidates.append({
-                'doc_id': result['key'],
-                'content': content,
-                'metadata': metadata,
-                'summary': summary,
-                'semantic_score': sem_score,
-                'keyword_score': kw_score,
-                'metadata_score': metadata_score,
-                'matched_terms': matched_terms
-            })
-
-        # Normalize scores and blend
-        max_kw = max((c['keyword_score'] for c in candidates), default=0.0)
-        max_meta = max((c['metadata_score'] for c in candidates), default=0.0)
-        for c in candidates:
-            norm_kw = (c['keyword_score'] / max_kw) if max_kw > 0 else 0.0
-            norm_meta = (c['metadata_score'] / max_meta) if max_meta > 0 else 0.0
-            c['hybrid_score'] = semantic_weight * c['semantic_score'] + keyword_weight * norm_kw + 0.05 * norm_meta
-            print(f"DEBUG: Candidate {c['doc_id']}: semantic_score={c['semantic_score']}, keyword_score={c['keyword_score']}, metadata_score={c['metadata_score']}, matched_terms={c['matched_terms']}, hybrid_score={c['hybrid_score']}")
-        print(f"DEBUG: Scoring time: {time.time() - score_start:.3f}s")
+        candidates = _build_candidates(vector_response['vectors'], keyword_re, persona)
+        hybrid = _blend_scores(candidates, semantic_weight, keyword_weight)
+        logger.debug("Scoring time: %.3fs", time.time() - score_start)
 
-        # 5️⃣ Cluster for diversity (prioritize leadership for CISO queries)
+        # 6️⃣ Cluster for diversity (prioritize leadership for CISO queries)
         cluster_start = time.time()
-        leadership_candidates = [c for c in candidates if sum(c['content'].lower().count(t) for t in leadership_terms) >= sum(c['content'].lower().count(t) for t in technical_terms)]
-        technical_candidates = [c for c in candidates if c not in leadership_candidates]
-        top_docs = []
-        if persona == "leadership" and leadership_candidates:
-            leadership_candidates.sort(key=lambda x: x['hybrid_score'], reverse=True)
-            top_docs.extend(leadership_candidates[:2])
-            if len(top_docs) < 2 and technical_candidates:
-                technical_candidates.sort(key=lambda x: x['hybrid_score'], reverse=True)
-                top_docs.append(technical_candidates[0])
-        else:
-            candidates.sort(key=lambda x: x['hybrid_score'], reverse=True)
-            top_docs = candidates[:5]
-        print(f"DEBUG: Clustering time: {time.time() - cluster_start:.3f}s")
+        top_docs = _cluster_top(candidates, hybrid, persona)
+        logger.debug("Clustering time: %.3fs", time.time() - cluster_start)
 
-        # 6️⃣ Collect results with valid links
+        # 7️⃣ Collect results with valid links
         link_start = time.time()
-        valid_results = []
-        for doc in top_docs:
-            metadata = doc.get('metadata', {})
-            links = {}
-            for key, value in [
-                ("external_youtube_link", metadata.get("External Youtube Link", "")),
-                ("content_link", metadata.get("Content Link", "")),
-                ("deck_link", metadata.get("Deck Link", "")),
-                ("internal_broadcast_link", metadata.get("Internal Broadcast Video Link", ""))
-            ]:
-                if value and value.lower() not in ["not available", ""]:
-                    links[key] = value
-            if links:
-                valid_results.append({
-                    "doc_id": doc['doc_id'],
-                    "links": links,
-                    "hybrid_score": doc['hybrid_score'],
-                    "summary": doc['summary']
-                })
-        print(f"DEBUG: Link filtering time: {time.time() - link_start:.3f}s")
-
-        # 7️⃣ If fewer than 2 results with valid links, retry with topK=15
+        valid_results = _extract_valid_results(top_docs)
+        if len(valid_results) < 2:
+            # Usually links were filtered out, not relevance; lower-ranked candidates may have them
+            valid_results = _refill_valid_results(valid_results, candidates, hybrid)
+        logger.debug("Link filtering time: %.3fs", time.time() - link_start)
+
+        # 8️⃣ If fewer than 2 results with valid links, retry with topK=15
         if len(valid_results) < 2:
             retry_start = time.time()
-            print(f"DEBUG: Found {len(valid_results)} videos with valid links, retrying with topK=15")
+            logger.debug("Found %d videos with valid links, retrying with topK=15", len(valid_results))
             vector_query["topK"] = 15
             vector_response = s3vectors.query_vectors(**vector_query)
             if vector_response.get('vectors'):
-                candidates = []
-                for result in vector_response['vectors']:
-                    content = result.get('metadata', {}).get('source_text', '')
-                    content_lower = content.lower()
-                    sem_score = 1 - result.get('distance', 1.0)
-                    kw_score = sum(content_lower.count(kw) for kw in all_keywords) / max(1, len(content_lower.split()))
-                    metadata = result.get('metadata', {})
-                    summary = metadata.get('Video Transcript Summary', 'No summary available.')
-                    sentences = summary.split('.')
-                    summary = '. '.join(sentences[:2]).strip() + ('.' if sentences else '')
-                    topics = metadata.get('When Was Each Topic Discussed', '').lower()
-                    combined_text = content_lower + ' ' + summary.lower() + ' ' + topics
-                    matched_terms = []
-                    metadata_score = 0.0
-                    if persona == "leadership":
-                        metadata_score = sum(combined_text.count(term) for term in leadership_terms) / max(1, len(combined_text.split()))
-                        matched_terms = [term for term in leadership_terms if term in combined_text]
-                    elif persona == "technical":
-                        metadata_score = sum(combined_text.count(term) for term in technical_terms) / max(1, len(combined_text.split()))
-                        matched_terms = [term for term in technical_terms if term in combined_text]
-
-                    candidates.append({
-                        'doc_id': result['key'],
-                        'content': content,
-                        'metadata': metadata,
-                        'summary': summary,
-                        'semantic_score': sem_score,
-                        'keyword_score': kw_score,
-                        'metadata_score': metadata_score,
-                        'matched_terms': matched_terms
-                    })
-
-                # Normalize and blend scores
-                max_kw = max((c['keyword_score'] for c in candidates), default=0.0)
-                max_meta = max((c['metadata_score'] for c in candidates), default=0.0)
-                for c in candidates:
-                    norm_kw = (c['keyword_score'] / max_kw) if max_kw > 0 else 0.0
-                    norm_meta = (c['metadata_score'] / max_meta) if max_meta > 0 else 0.0
-                    c['hybrid_score'] = semantic_weight * c['semantic_score'] + keyword_weight * norm_kw + 0.05 * norm_meta
-                    print(f"DEBUG: Candidate {c['doc_id']}: semantic_score={c['semantic_score']}, keyword_score={c['keyword_score']}, metadata_score={c['metadata_score']}, matched_terms={c['matched_terms']}, hybrid_score={c['hybrid_score']}")
-                print(f"DEBUG: Scoring time: {time.time() - score_start:.3f}s")
-
-                # Cluster again
-                leadership_candidates = [c for c in candidates if sum(c['content'].lower().count(t) for t in leadership_terms) >= sum(c['content'].lower().count(t) for t in technical_terms)]
-                technical_candidates = [c for c in candidates if c not in leadership_candidates]
-                top_docs = []
-                if persona == "leadership" and leadership_candidates:
-                    leadership_candidates.sort(key=lambda x: x['hybrid_score'], reverse=True)
-                    top_docs.extend(leadership_candidates[:2])
-                    if len(top_docs) < 2 and technical_candidates:
-                        technical_candidates.sort(key=lambda x: x['hybrid_score'], reverse=True)
-                        top_docs.append(technical_candidates[0])
-                else:
-                    candidates.sort(key=lambda x: x['hybrid_score'], reverse=True)
-                    top_docs = candidates[:5]
-
-                valid_results = []
-                for doc in top_docs:
-                    metadata = doc.get('metadata', {})
-                    links = {}
-                    for key, value in [
-                        ("external_youtube_link", metadata.get("External Youtube Link", "")),
-                        ("content_link", metadata.get("Content Link", "")),
-                        ("deck_link", metadata.get("Deck Link", "")),
-                        ("internal_broadcast_link", metadata.get("Internal Broadcast Video Link", ""))
-                    ]:
-                        if value and value.lower() not in ["not available", ""]:
-                            links[key] = value
-                    if links:
-                        valid_results.append({
-                            "doc_id": doc['doc_id'],
-                            "links": links,
-                            "hybrid_score": doc['hybrid_score'],
-                            "summary": doc['summary']
-                        })
-            print(f"DEBUG: Retry search time: {time.time() - retry_start:.3f}s")
-
-        # 8️⃣ Prepare output
+                # The first 10 hits are normally a subset of the retry, so only score the new ones
+                scored_by_id = {c['doc_id']: c for c in candidates}
+                new_vectors = [v for v in vector_response['vectors'] if v['key'] not in scored_by_id]
+                scored_by_id.update((c['doc_id'], c) for c in _build_candidates(new_vectors, keyword_re, persona))
+                candidates = [scored_by_id[v['key']] for v in vector_response['vectors']]
+                logger.debug("Scoring %d new of %d retry candidates", len(new_vectors), len(candidates))
+
+                # Normalization maxima may change with the new candidates, so re-blend all
+                hybrid = _blend_scores(candidates, semantic_weight, keyword_weight)
+                top_docs = _cluster_top(candidates, hybrid, persona)
+                valid_results = _extract_valid_results(top_docs)
+                if len(valid_results) < 2:
+                    valid_results = _refill_valid_results(valid_results, candidates, hybrid)
+            logger.debug("Retry search time: %.3fs", time.time() - retry_start)
+
+        # 9️⃣ Prepare output
         output_start = time.time()
         if len(valid_results) < 2:
             return {
@@ -314,7 +372,7 @@ def search_transcripts(query: str) -> dict:
         # Take top 2 results with valid links
         filtered_results = valid_results[:2]
 
-        # 9️⃣ Generate final recommendation
+        # 🔟 Generate final recommendation
         final_recommendation = "No relevant results found."
         if filtered_results:
             recommendation_level = "Highly recommended" if filtered_results[0]['hybrid_score'] > 0.5 else "Moderately relevant"
@@ -327,8 +385,8 @@ def search_transcripts(query: str) -> dict:
                 f"Start with Video 1 for its focus on AI agent security."
             )
 
-        print(f"DEBUG: Recommendation generation time: {time.time() - output_start:.3f}s")
-        print(f"DEBUG: Total execution time: {time.time() - start_time:.3f}s")
+        logger.debug("Recommendation generation time: %.3fs", time.time() - output_start)
+        logger.debug("Total execution time: %.3fs", time.time() - start_time)
 
         return {
             "output": {
@@ -340,9 +398,30 @@ def search_transcripts(query: str) -> dict:
     except ClientError as e:
         return {"output": {"message": f"ClientError: {e}"}}
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("search_transcripts failed")
         return {"output": {"message": f"Exception: {e}"}}
 
+@tool
+def search_transcripts(query: str) -> dict:
+    # Returned as a JSON tool-result block (not the str() of the dict) so invoke()
+    # can read it back from the agent messages as a dict
+    return {"status": "success", "content": [{"json": _search_transcripts(query)}]}
+
+def _latest_tool_json(messages):
+    # Newest JSON tool result of the current turn; the turn starts at the user prompt
+    for message in reversed(messages):
+        content = message.get("content", [])
+        for block in reversed(content):
+            for item in block.get("toolResult", {}).get("content", []):
+                if "json" in item:
+                    return item["json"]
+        if message.get("role") == "user" and any("text" in block for block in content):
+            return None
+    return None
+
+# Unescapes \" and \\ in a single pass when repairing a stringified JSON response
+_ESCAPED_JSON_RE = re.compile(r'\\(["\\])')
+
 # ==== Agent setup ====
 bedrock_model = BedrockModel(modelId=reasoning_model_id, session=get_aws_session()[0])
 content_agent = Agent(
@@ -357,15 +436,19 @@ def invoke(payload):
     if not prompt:
         return {"output": {"error": "No prompt provided"}}, 400
     response = content_agent(prompt)
+    # Prefer the tool's structured output from this invocation over the model's text
+    tool_output = _latest_tool_json(content_agent.messages)
+    if tool_output is not None:
+        return tool_output
     # Parse response if it's a string or list to extract JSON
     if isinstance(response, (str, list)):
         try:
             if isinstance(response, list):
-                response = ''.join(r.strip("b'\"").rstrip("'") for r in response)
-            cleaned_response = response.strip("b'\"").rstrip("'").replace("\\\"", "\"").replace("\\\\", "\\")
-            return json.loads(cleaned_response)
+                response = ''.join(r.removeprefix("b'").removesuffix("'").strip('"') for r in response)
+            cleaned_response = _ESCAPED_JSON_RE.sub(r"\1", response.removeprefix("b'").removesuffix("'").strip('"'))
+            return json_loads(cleaned_response)
         except json.JSONDecodeError as e:
-            print(f"DEBUG: Failed to parse response as JSON: {e}")
+            logger.warning("Failed to parse response as JSON: %s", e)
             return {"output": {"message": f"JSONDecodeError: {e}"}}
     return response
 
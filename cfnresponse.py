@@ -1,9 +1,20 @@
 import json
-import requests
+import urllib3
+
+# orjson encodes straight to bytes; fall back to stdlib json where it isn't installed
+try:
+    from orjson import dumps as _dumps_bytes
+except ImportError:
+    def _dumps_bytes(obj):
+        return json.dumps(obj).encode("utf-8")
 
 SUCCESS = "SUCCESS"
 FAILED = "FAILED"
 
+# Module-level pool so warm invocations reuse the TLS connection; a separate connect
+# timeout makes DNS/TLS hangs fail fast instead of eating into the read budget.
+_HTTP = urllib3.PoolManager(maxsize=2, timeout=urllib3.Timeout(connect=3.0, read=7.0))
+
 def send(event, context, responseStatus, responseData, physicalResourceId=None, noEcho=False, reason=None):
     responseUrl = event['ResponseURL']
 
@@ -20,8 +31,9 @@ def send(event, context, responseStatus, responseData, physicalResourceId=None,
         'Data': responseData
     }
 
-    json_responseBody = json.dumps(responseBody)
+    json_responseBody = _dumps_bytes(responseBody)
 
+    # S3 pre-signed URLs reject chunked uploads, so the byte length is always sent
     headers = {
         'content-type': 'application/json',
         'content-length': str(len(json_responseBody))
@@ -30,15 +42,13 @@ def send(event, context, responseStatus, responseData, physicalResourceId=None,
     try:
         if not responseUrl.startswith("https://"):
             raise ValueError("Response URL must use HTTPS scheme")
-        response = requests.put(responseUrl, data=json_responseBody, headers=headers, timeout=10)
-        response.raise_for_status()
-        print(f"Status code: {response.status_code}, reason: {response.reason}")
-    except ImportError as e:
-        print(f"Failed to import requests module: {str(e)}")
-        raise
-    except requests.exceptions.RequestException as e:
+        response = _HTTP.request("PUT", responseUrl, body=json_responseBody, headers=headers)
+        if response.status >= 400:
+            raise urllib3.exceptions.HTTPError(f"HTTP {response.status} {response.reason} from response URL")
+        print(f"Status code: {response.status}, reason: {response.reason}")
+    except urllib3.exceptions.HTTPError as e:
         print(f"send(..) failed with exception: {str(e)}")
         raise
     except ValueError as e:
         print(f"Invalid response URL: {str(e)}")
-        raise
\ No newline at end of file
+        raise
@@ -1,36 +1,81 @@
 # DEBUG: build timestamp 2025-08-13T09:08 PDT
 
 import json
+import hashlib
+import zlib
 import boto3
 import logging
 import os
 import urllib.parse
-import pandas as pd
+import queue
+import re
+import tempfile
+import threading
+import time
 import numpy as np
-from io import BytesIO
+import openpyxl
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from botocore.config import Config
 from botocore.exceptions import ClientError
-import nltk
 
-nltk.data.path.append("/var/task/nltk_data")
-from nltk.tokenize import word_tokenize
+# orjson parses the float-heavy embedding payloads several times faster; fall back to stdlib json
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    json_dumps, json_loads = json.dumps, json.loads
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-TOKEN_CHUNK_SIZE = 6000
+# Whitespace tokens per chunk; kept well under Titan v2's 8k-token input limit since
+# subword tokens outnumber words
+TOKEN_CHUNK_SIZE = 4500
 BATCH_SIZE = 100
+# Bounds embedding calls (and Lambda run time) for pathologically long transcripts
+MAX_CHUNKS_PER_ROW = int(os.environ.get("MAX_CHUNKS_PER_ROW", 256))
+# Titan embeddings take one input per request, so chunks are embedded concurrently
+# to overlap the network round-trips; the client pool is sized to match.
+EMBED_MAX_WORKERS = int(os.environ.get("EMBED_MAX_WORKERS", 32))
+# Embedding requests allowed in flight ahead of the chunk currently being assembled
+EMBED_WINDOW = 2 * EMBED_MAX_WORKERS
+EMBED_MODEL_ID = "amazon.titan-embed-text-v2:0"
+# Titan v2 returns the requested number of dimensions, so no probe call is needed. Fixed at
+# the model default because the agent's query embeddings must match the index dimension.
+EMBED_DIM = 1024
+# Optional DynamoDB table caching embeddings by content hash, so unchanged chunks
+# are not re-embedded when a workbook is uploaded again
+EMBED_CACHE_TABLE = os.environ.get("EMBED_CACHE_TABLE")
+# Unprocessed cache keys/items are retried with exponential backoff, then given up on
+CACHE_MAX_ATTEMPTS = 4
+CACHE_RETRY_BASE_DELAY = 0.1
+_CACHE_KEY_PUNCT_RE = re.compile(r"[^\w\s]+")
+EXCEL_SPOOL_SIZE = 64 << 20
+# (vector bucket, index) pairs known to exist, kept across warm invocations
+_INDEX_READY = set()
+
+# Clients are created once per container and reused across warm invocations
+_S3 = boto3.client("s3", region_name="us-east-1", config=Config(max_pool_connections=64))
+_S3V = boto3.client("s3vectors", region_name="us-east-1")
+_BR = boto3.client(
+    "bedrock-runtime",
+    region_name="us-east-1",
+    config=Config(
+        max_pool_connections=max(EMBED_MAX_WORKERS, 64),
+        retries={"mode": "adaptive", "total_max_attempts": 5}
+    )
+)
+_DDB = boto3.client("dynamodb", region_name="us-east-1") if EMBED_CACHE_TABLE else None
 
 def chunk_transcript(transcript: str):
-    tokens = word_tokenize(str(transcript))
-    return [
-        " ".join(tokens[i:i + TOKEN_CHUNK_SIZE])
-        for i in range(0, len(tokens), TOKEN_CHUNK_SIZE)
-        if " ".join(tokens[i:i + TOKEN_CHUNK_SIZE]).strip()
-    ]
+    # split() drops empty tokens, so every window is non-empty and needs no strip check
+    tokens = str(transcript).split()
+    return [" ".join(tokens[i:i + TOKEN_CHUNK_SIZE]) for i in range(0, len(tokens), TOKEN_CHUNK_SIZE)]
 
 def handler(event, context):
     print("***** DEBUG: create_index.py build timestamp 2025-08-13T09:08 PDT *****")
-    logger.info(f"Handler invoked with event: {json.dumps(event)}")
+    logger.info("Handler invoked with event: %s", event)
     source_bucket = os.environ.get("SOURCE_BUCKET")
     vector_bucket = os.environ.get("VECTOR_BUCKET")
     index_name = os.environ.get("INDEX_NAME")
@@ -41,72 +86,85 @@ def handler(event, context):
         logger.error(f"Missing environment variables: SOURCE_BUCKET={source_bucket}, VECTOR_BUCKET={vector_bucket}, INDEX_NAME={index_name}")
         raise ValueError("Missing environment variables")
 
-    s3 = boto3.client("s3", region_name="us-east-1")
-    s3vectors_client = boto3.client("s3vectors", region_name="us-east-1")
-    bedrock = boto3.client("bedrock-runtime", region_name="us-east-1")
-
     for record in event["Records"]:
         bucket = record["s3"]["bucket"]["name"]
         key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
         logger.info(f"Processing file: s3://{bucket}/{key}")
         print(f"DEBUG: Processing file s3://{bucket}/{key}")
 
-        try:
-            response = s3.get_object(Bucket=bucket, Key=key)
-            excel_data = response["Body"].read()
-        except Exception as e:
-            logger.warning(f"Failed to read S3 object s3://{bucket}/{key}: {str(e)}")
-            print(f"DEBUG: Failed to read S3 object: {str(e)}")
-            raise
+        # Spool the object in memory, spilling to /tmp only for unusually large workbooks
+        with tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_SIZE) as excel_file:
+            try:
+                _S3.download_fileobj(bucket, key, excel_file)
+                excel_file.seek(0)
+            except Exception as e:
+                logger.warning(f"Failed to read S3 object s3://{bucket}/{key}: {str(e)}")
+                print(f"DEBUG: Failed to read S3 object: {str(e)}")
+                raise
 
-        try:
-            df = pd.read_excel(BytesIO(excel_data))
-            logger.info(f"Read Excel file with {len(df)} rows and columns: {list(df.columns)}")
-            print(f"DEBUG: Excel file read, {len(df)} rows, columns: {list(df.columns)}")
-        except Exception as e:
-            logger.warning(f"Failed to parse Excel file: {str(e)}")
-            print(f"DEBUG: Failed to parse Excel file: {str(e)}")
-            raise
-
-        content_column = "Full Video Transcript"
-        if content_column not in df.columns:
-            logger.warning(f"Expected column '{content_column}' not found in Excel file.")
-            print(f"DEBUG: Expected column '{content_column}' not found")
-            raise ValueError(f"Missing required column '{content_column}'")
-
-        first_content = None
-        for _, row in df.iterrows():
-            val = row.get(content_column, "")
-            if pd.notna(val) and str(val).strip():
-                first_content = str(val)
-                break
-
-        if not first_content:
+            try:
+                # Read-only mode streams rows from the sheet XML instead of loading the workbook
+                workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+                rows = workbook.active.iter_rows(values_only=True)
+                header = next(rows, ())
+                col_index = {str(name): i for i, name in enumerate(header) if name is not None}
+                logger.info("Reading Excel file with columns: %s", list(col_index))
+            except Exception as e:
+                logger.warning(f"Failed to parse Excel file: {str(e)}")
+                print(f"DEBUG: Failed to parse Excel file: {str(e)}")
+                raise
+
+            content_column = "Full Video Transcript"
+            if content_column not in col_index:
+                workbook.close()
+                logger.warning(f"Expected column '{content_column}' not found in Excel file.")
+                print(f"DEBUG: Expected column '{content_column}' not found")
+                raise ValueError(f"Missing required column '{content_column}'")
+
+            content_idx = col_index[content_column]
+            metadata_columns = [(col, i) for col, i in col_index.items() if col != content_column]
+
+            # Collect every chunk of the file in one streaming pass so they can be embedded concurrently
+            jobs = []
+            cache_keys = []
+            try:
+                for row_index, row in enumerate(rows):
+                    # Read-only mode also yields formatted but blank rows, which pandas used to drop
+                    if not any(value is not None for value in row):
+                        continue
+                    content = row[content_idx] if content_idx < len(row) else None
+                    if content is None or not str(content).strip():
+                        logger.warning("Skipping row %d with empty transcript", row_index)
+                        continue
+
+                    chunks = chunk_transcript(content)
+                    if len(chunks) > MAX_CHUNKS_PER_ROW:
+                        # Sample evenly across the transcript rather than keeping only its start
+                        keep = np.linspace(0, len(chunks) - 1, MAX_CHUNKS_PER_ROW).astype(int)
+                        logger.warning(
+                            "Row %d has %d chunks; sampling %d of them",
+                            row_index, len(chunks), MAX_CHUNKS_PER_ROW
+                        )
+                        chunks = [chunks[i] for i in keep]
+                    # Every chunk of a row shares the same column metadata
+                    row_metadata = {col: _cell_str(row, i) for col, i in metadata_columns}
+                    for chunk_idx, chunk in enumerate(chunks):
+                        jobs.append((row_index, chunk_idx, chunk, row_metadata))
+                        cache_keys.append(_embedding_cache_key(chunk))
+            finally:
+                workbook.close()
+
+        if not jobs:
             logger.warning(f"No non-empty '{content_column}' found in file.")
             print(f"DEBUG: No non-empty '{content_column}'")
             raise ValueError(f"No valid transcript text found in '{content_column}'")
 
-        try:
-            preview_text = first_content[:1024]
-            bedrock_resp = bedrock.invoke_model(
-                modelId="amazon.titan-embed-text-v2:0",
-                body=json.dumps({"inputText": preview_text})
-            )
-            first_embedding = json.loads(bedrock_resp["body"].read())["embedding"]
-            dimension = len(first_embedding)
-            logger.info(f"Determined embedding dimension: {dimension}")
-            print(f"DEBUG: Titan embedding dimension: {dimension}")
-        except ClientError as e:
-            logger.warning(f"Error generating first embedding: {e.response['Error']['Message']}")
-            print(f"DEBUG: Error generating embedding: {e.response['Error']['Message']}")
-            raise
-
-        # Create index if not exists
-        try:
-            idx_resp = s3vectors_client.list_indexes(vectorBucketName=vector_bucket)
-            existing_indexes = [idx["indexName"] for idx in idx_resp.get("indexes", [])]
-            if index_name not in existing_indexes:
-                s3vectors_client.create_index(
+        dimension = EMBED_DIM
+
+        # Create the index on first use; warm invocations skip the control-plane call entirely
+        if (vector_bucket, index_name) not in _INDEX_READY:
+            try:
+                _S3V.create_index(
                     vectorBucketName=vector_bucket,
                     indexName=index_name,
                     dataType="float32",
@@ -128,66 +186,106 @@ def handler(event, context):
                 )
                 logger.info(f"Created vector index '{index_name}' in bucket '{vector_bucket}'")
                 print(f"DEBUG: Created vector index {index_name}")
-            else:
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("ConflictException", "ResourceAlreadyExistsException"):
+                    logger.warning(f"Error ensuring index exists: {e.response['Error']['Message']}")
+                    print(f"DEBUG: Error ensuring index exists: {e.response['Error']['Message']}")
+                    raise
                 logger.info(f"Vector index '{index_name}' already exists in '{vector_bucket}'")
-                print(f"DEBUG: Vector index already exists: {index_name}")
-        except ClientError as e:
-            logger.warning(f"Error ensuring index exists: {e.response['Error']['Message']}")
-            print(f"DEBUG: Error ensuring index exists: {e.response['Error']['Message']}")
-            raise
+            _INDEX_READY.add((vector_bucket, index_name))
 
         vectors = []
-        metadata_columns = [col for col in df.columns if col != content_column]
-
-        for row_index, row in df.iterrows():
-            content = row.get(content_column, "")
-            if pd.isna(content) or not str(content).strip():
-                logger.warning(f"Skipping row {row_index} with empty transcript")
-                print(f"DEBUG: Skipping row {row_index}, empty transcript")
-                continue
-
-            chunks = chunk_transcript(content)
-            print(f"DEBUG: Row {row_index} transcript split into {len(chunks)} chunks")
-            for chunk_idx, chunk in enumerate(chunks):
-                try:
-                    resp = bedrock.invoke_model(
-                        modelId="amazon.titan-embed-text-v2:0",
-                        body=json.dumps({"inputText": chunk})
-                    )
-                    embedding = json.loads(resp["body"].read())["embedding"]
-                    if len(embedding) != dimension:
-                        logger.warning(f"Skipping chunk {chunk_idx} of row {row_index} due to dimension mismatch")
-                        print(f"DEBUG: Skipping chunk {chunk_idx} dim mismatch")
+        cached = _get_cached_embeddings(_DDB, cache_keys) if EMBED_CACHE_TABLE else {}
+        logger.info("Embedding cache hits: %d of %d unique chunks", len(cached), len(set(cache_keys)))
+        # Embeddings created for the batch being assembled; cached as the batch is handed off
+        new_embeddings = {}
+
+        # Uploads run on a background thread so put_vectors round-trips overlap embedding
+        upload_q, uploader, upload_errors = _start_uploader(_S3V, vector_bucket, index_name)
+        chunks_per_row = Counter(job[0] for job in jobs)
+        row_ok = row_failed = 0
+        try:
+            with ThreadPoolExecutor(max_workers=EMBED_MAX_WORKERS) as executor:
+                # Fixed request arguments are bound once; only the body varies per chunk
+                invoke_embed = partial(
+                    _BR.invoke_model,
+                    modelId=EMBED_MODEL_ID,
+                    contentType="application/json",
+                    accept="application/json"
+                )
+                # Titan takes one input per request, so identical chunks share a single request.
+                # Jobs still to be read per key let a future be dropped after its last duplicate.
+                uses_left = Counter()
+                to_embed = []
+                for cache_key, job in zip(cache_keys, jobs):
+                    if cache_key not in cached:
+                        if not uses_left[cache_key]:
+                            to_embed.append((cache_key, job))
+                        uses_left[cache_key] += 1
+                pending = {}
+                submitted = started = 0
+
+                row_started = time.monotonic()
+                # Results are consumed in job order, so batches upload while later chunks are still embedding
+                for (row_index, chunk_idx, chunk, row_metadata), cache_key in zip(jobs, cache_keys):
+                    # Keep at most EMBED_WINDOW requests ahead of the chunk being read, so memory is
+                    # bounded by the window rather than the file, and a full upload queue stalls embedding
+                    while submitted < len(to_embed) and submitted - started < EMBED_WINDOW:
+                        key, job = to_embed[submitted]
+                        pending[key] = executor.submit(_embed_chunk, invoke_embed, *job[:3])
+                        submitted += 1
+
+                    if cache_key in cached:
+                        embedding = cached[cache_key].tolist()
+                    else:
+                        first_use = started < len(to_embed) and to_embed[started][0] == cache_key
+                        if first_use:
+                            started += 1
+                        embedding = pending[cache_key].result()
+                        uses_left[cache_key] -= 1
+                        if not uses_left[cache_key]:
+                            del pending[cache_key]
+                        if first_use and embedding is not None:
+                            new_embeddings[cache_key] = embedding
+                    embedded = embedding is not None and len(embedding) == dimension
+                    if embedded:
+                        row_ok += 1
+                    else:
+                        row_failed += 1
+                    # One summary line per row instead of logging every chunk
+                    if chunk_idx == chunks_per_row[row_index] - 1:
+                        logger.info(
+                            "Row %d: %d chunks, %d embedded, %d failed in %.2fs",
+                            row_index, chunks_per_row[row_index], row_ok, row_failed,
+                            time.monotonic() - row_started
+                        )
+                        row_ok = row_failed = 0
+                        row_started = time.monotonic()
+                    if not embedded:
                         continue
 
-                    embedding = np.array(embedding, dtype=np.float32).tolist()
-                    metadata = {col: str(row.get(col, "Not available")) for col in metadata_columns}
+                    metadata = dict(row_metadata)
                     metadata["id"] = f"row-{row_index}-chunk-{chunk_idx}"
                     metadata["source_text"] = chunk
 
-                    # Final debug print: show vector schema in batch
                     vectors.append({
                         "key": f"row-{row_index}-chunk-{chunk_idx}",
                         "data": {"float32": embedding},
                         "metadata": metadata
                     })
-                    print(f"DEBUG: Adding vector key=row-{row_index}-chunk-{chunk_idx}, size={len(embedding)}")
 
                     if len(vectors) >= BATCH_SIZE:
-                        print(f"DEBUG: Uploading batch of {len(vectors)} vectors to index {index_name}")
-                        _upload_batch(s3vectors_client, vector_bucket, index_name, vectors)
-                        vectors.clear()
+                        upload_q.put((vectors, new_embeddings))
+                        vectors = []
+                        new_embeddings = {}
 
-                except ClientError as e:
-                    logger.warning(f"Failed to embed row {row_index} chunk {chunk_idx}: {e.response['Error']['Message']}")
-                    print(f"DEBUG: Embedding failed for row {row_index} chunk {chunk_idx}: {e.response['Error']['Message']}")
-                except Exception as e:
-                    logger.warning(f"Unexpected error embedding row {row_index} chunk {chunk_idx}: {str(e)}")
-                    print(f"DEBUG: Unexpected error for row {row_index} chunk {chunk_idx}: {str(e)}")
-
-        if vectors:
-            print(f"DEBUG: Uploading final batch of {len(vectors)} vectors")
-            _upload_batch(s3vectors_client, vector_bucket, index_name, vectors)
+            if vectors:
+                upload_q.put((vectors, new_embeddings))
+        finally:
+            upload_q.put(None)
+            uploader.join()
+        if upload_errors:
+            raise upload_errors[0]
 
     print("***** DEBUG: handler complete, exiting *****")
     return {
@@ -195,8 +293,108 @@ def handler(event, context):
         "body": json.dumps("Successfully processed Excel file")
     }
 
+def _cell_str(row, i):
+    # Empty cells (and cells past the row's last value) read as None in openpyxl
+    value = row[i] if i < len(row) else None
+    return "Not available" if value is None else str(value)
+
+def _embedding_cache_key(chunk):
+    # Key on case- and punctuation-insensitive text so trivial transcript edits still hit the cache
+    normalized = " ".join(_CACHE_KEY_PUNCT_RE.sub(" ", chunk.casefold()).split())
+    return hashlib.sha256(f"{EMBED_MODEL_ID}|{EMBED_DIM}|{normalized}".encode("utf-8")).hexdigest()
+
+def _get_cached_embeddings(dynamodb, cache_keys):
+    # BatchGetItem takes at most 100 unique keys per request
+    cached = {}
+    unique_keys = list(dict.fromkeys(cache_keys))
+    try:
+        for i in range(0, len(unique_keys), 100):
+            request = {EMBED_CACHE_TABLE: {
+                "Keys": [{"hash": {"S": key}} for key in unique_keys[i:i + 100]],
+                "ProjectionExpression": "#h, embedding",
+                "ExpressionAttributeNames": {"#h": "hash"}
+            }}
+            for attempt in range(CACHE_MAX_ATTEMPTS):
+                if attempt:
+                    time.sleep(CACHE_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                resp = dynamodb.batch_get_item(RequestItems=request)
+                for item in resp.get("Responses", {}).get(EMBED_CACHE_TABLE, []):
+                    try:
+                        blob = zlib.decompress(item["embedding"]["B"])
+                        cached[item["hash"]["S"]] = np.frombuffer(blob, dtype=np.float32)
+                    except (KeyError, ValueError, zlib.error) as e:
+                        logger.warning("Skipping unreadable embedding cache entry: %s", e)
+                request = resp.get("UnprocessedKeys")
+                if not request:
+                    break
+            else:
+                # Keys still unprocessed after the last attempt are simply treated as misses
+                logger.warning("Embedding cache reads still throttled after %d attempts", CACHE_MAX_ATTEMPTS)
+    except ClientError as e:
+        # The cache is an optimization only; fall back to embedding everything not yet read
+        logger.warning("Error reading embedding cache: %s", e.response["Error"]["Message"])
+    return cached
+
+def _put_cached_embeddings(dynamodb, embeddings):
+    # BatchWriteItem takes at most 25 items per request
+    items = [
+        {"PutRequest": {"Item": {
+            "hash": {"S": key},
+            "embedding": {"B": zlib.compress(np.asarray(embedding, dtype=np.float32).tobytes())}
+        }}}
+        for key, embedding in embeddings.items()
+    ]
+    try:
+        for i in range(0, len(items), 25):
+            request = {EMBED_CACHE_TABLE: items[i:i + 25]}
+            for attempt in range(CACHE_MAX_ATTEMPTS):
+                if attempt:
+                    time.sleep(CACHE_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                request = dynamodb.batch_write_item(RequestItems=request).get("UnprocessedItems")
+                if not request:
+                    break
+            else:
+                logger.warning(
+                    "Dropping %d embedding cache writes still throttled after %d attempts",
+                    len(request.get(EMBED_CACHE_TABLE, [])), CACHE_MAX_ATTEMPTS
+                )
+    except ClientError as e:
+        logger.warning("Error writing embedding cache: %s", e.response["Error"]["Message"])
+
+def _start_uploader(s3vectors_client, vector_bucket, index_name):
+    # Bounded so batch assembly blocks once a few batches are waiting; since embedding requests
+    # are only submitted as the handler reads results, that also stalls embedding
+    upload_q = queue.Queue(maxsize=4)
+    upload_errors = []
+
+    def _upload_worker():
+        while (item := upload_q.get()) is not None:
+            batch, new_embeddings = item
+            # Cache before uploading so a failed or timed-out run still keeps what it embedded
+            if EMBED_CACHE_TABLE and new_embeddings:
+                _put_cached_embeddings(_DDB, new_embeddings)
+            if upload_errors:
+                continue  # keep draining so the producer never blocks after a failure
+            try:
+                _upload_batch(s3vectors_client, vector_bucket, index_name, batch)
+            except Exception as e:
+                upload_errors.append(e)
+
+    uploader = threading.Thread(target=_upload_worker, daemon=True)
+    uploader.start()
+    return upload_q, uploader, upload_errors
+
+def _embed_chunk(invoke_embed, row_index, chunk_idx, chunk):
+    try:
+        resp = invoke_embed(body=json_dumps({"inputText": chunk, "dimensions": EMBED_DIM}))
+        return json_loads(resp["body"].read())["embedding"]
+    except ClientError as e:
+        logger.warning(f"Failed to embed row {row_index} chunk {chunk_idx}: {e.response['Error']['Message']}")
+    except Exception as e:
+        logger.warning(f"Unexpected error embedding row {row_index} chunk {chunk_idx}: {str(e)}")
+    return None
+
 def _upload_batch(s3vectors_client, vector_bucket, index_name, batch):
-    print(f"DEBUG: _upload_batch called with {len(batch)} vectors")
     try:
         resp = s3vectors_client.put_vectors(
             vectorBucketName=vector_bucket,
@@ -204,12 +402,9 @@ def _upload_batch(s3vectors_client, vector_bucket, index_name, batch):
             vectors=batch
         )
         logger.info(f"Uploaded batch of {len(batch)} vectors: HTTP {resp.get('ResponseMetadata', {}).get('HTTPStatusCode')}")
-        print(f"DEBUG: Batch upload HTTP status {resp.get('ResponseMetadata', {}).get('HTTPStatusCode')}")
     except ClientError as e:
         logger.warning(f"Error uploading batch: {e.response['Error']['Message']}")
-        print(f"DEBUG: Error uploading batch: {e.response['Error']['Message']}")
         raise
     except Exception as e:
         logger.warning(f"Unexpected error uploading batch: {str(e)}")
-        print(f"DEBUG: Unexpected error uploading batch: {str(e)}")
         raise
\ No newline at end of file